@@ -2,15 +2,16 @@
 
 import logging
 import os
-from glob import glob
 
 import dateparser
 import shutil
 import socket
 import multiprocessing
 from collections import defaultdict
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, AnyStr, List, Union, Tuple
+from time import time
+from typing import Dict, AnyStr, List, Optional, Union, Tuple
 from geoip2.database import Reader
 from geoip2.errors import AddressNotFoundError
 from geoip2.models import City
@@ -19,6 +20,12 @@ import yaml
 from jsonschema import ValidationError, validate
 from urllib3.exceptions import HTTPError
 
+# libyaml based loader is much faster, but PyYAML can be built without it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 
 MIRROR_CONFIG_SCHEMA = {
     "$schema": "http://json-schema.org/draft-04/schema#",
@@ -82,7 +89,8 @@ REQUIRED_MIRROR_PROTOCOLS = (
     'https',
     'http',
 )
-ALL_MIRROR_PROTOCOLS = list(REQUIRED_MIRROR_PROTOCOLS)
+# dict is used as an ordered set of protocols of all mirrors
+ALL_MIRROR_PROTOCOLS = dict.fromkeys(REQUIRED_MIRROR_PROTOCOLS)
 
 ARCHS = (
     'x86_64',
@@ -118,7 +126,34 @@ def get_config(path_to_config: AnyStr = 'config.yml') -> Dict:
     """
 
     with open(path_to_config, mode='r') as config_file:
-        return yaml.safe_load(config_file)
+        return yaml.load(config_file, Loader=SafeLoader)
+
+
+@lru_cache(maxsize=None)
+def get_http_session() -> requests.Session:
+    """
+    Return HTTP session of the current process. It keeps connections
+    alive, so all checks of a mirror don't reconnect to it
+    """
+
+    return requests.Session()
+
+
+def get_mirror_url(
+        addresses: Dict[AnyStr, AnyStr],
+) -> Optional[AnyStr]:
+    """
+    Return the first address of a mirror with one of required protocols
+    :param addresses: the dictionary of addresses of a mirror by protocols
+    """
+
+    return next(
+        (
+            address for protocol_type, address in addresses.items()
+            if protocol_type in REQUIRED_MIRROR_PROTOCOLS
+        ),
+        None,
+    )
 
 
 def mirror_available(
@@ -134,13 +169,8 @@ def mirror_available(
     :param repos: the list of repos which should be provided by a mirror
     """
     logger.info('Checking mirror "%s"...', mirror_info['name'])
-    try:
-        addresses = mirror_info['address']  # type: Dict[AnyStr, AnyStr]
-        mirror_url = next(iter([
-            address for protocol_type, address in addresses.items()
-            if protocol_type in REQUIRED_MIRROR_PROTOCOLS
-        ]))
-    except StopIteration:
+    mirror_url = mirror_info['mirror_url']
+    if mirror_url is None:
         logger.error(
             'Mirror "%s" has no one address with protocols "%s"',
             mirror_info['name'],
@@ -157,7 +187,11 @@ def mirror_available(
                 'repodata/repomd.xml',
             )
             try:
-                request = requests.get(check_url, headers=HEADERS, timeout=60)
+                request = get_http_session().get(
+                    check_url,
+                    headers=HEADERS,
+                    timeout=60,
+                )
                 request.raise_for_status()
             except (requests.RequestException, HTTPError):
                 logger.warning(
@@ -175,6 +209,19 @@ def mirror_available(
     return mirror_info['name'], True
 
 
+@lru_cache(maxsize=None)
+def get_allowed_lag(allowed_outdate: AnyStr) -> float:
+    """
+    Convert allowed mirror lag to seconds. dateparser is slow, so
+    it's parsed only once instead of for an each mirror
+    :param allowed_outdate: allowed mirror lag
+    """
+
+    return time() - dateparser.parse(
+        f'now-{allowed_outdate} UTC'
+    ).timestamp()
+
+
 def set_repo_status(
         mirror_info: Dict[AnyStr, Union[Dict, AnyStr]],
         allowed_outdate: AnyStr
@@ -186,17 +233,12 @@ def set_repo_status(
     :return: Status of a mirror: expired or ok
     """
 
-    addresses = mirror_info['address']
-    mirror_url = next(iter([
-        address for protocol_type, address in addresses.items()
-        if protocol_type in REQUIRED_MIRROR_PROTOCOLS
-    ]))
     timestamp_url = os.path.join(
-        mirror_url,
+        mirror_info['mirror_url'],
         'TIME',
     )
     try:
-        request = requests.get(
+        request = get_http_session().get(
             url=timestamp_url,
             headers=HEADERS,
         )
@@ -210,9 +252,7 @@ def set_repo_status(
         mirror_info['status'] = 'expired'
         return
     try:
-        mirror_should_updated_at = dateparser.parse(
-            f'now-{allowed_outdate} UTC'
-        ).timestamp()
+        mirror_should_updated_at = time() - get_allowed_lag(allowed_outdate)
         try:
             mirror_last_updated = float(request.content)
         except ValueError:
@@ -245,7 +285,7 @@ def get_mirrors_info(
     result = []
     for config_path in Path(mirrors_dir).rglob('*.yml'):
         with open(str(config_path), 'r') as config_file:
-            mirror_info = yaml.safe_load(config_file)
+            mirror_info = yaml.load(config_file, Loader=SafeLoader)
             try:
                 validate(
                     mirror_info,
@@ -257,9 +297,12 @@ def get_mirrors_info(
                     config_path,
                     err,
                 )
-            ALL_MIRROR_PROTOCOLS.extend(
-                protocol for protocol in mirror_info['address'].keys() if
-                protocol not in ALL_MIRROR_PROTOCOLS
+            ALL_MIRROR_PROTOCOLS.update(
+                dict.fromkeys(mirror_info['address']),
+            )
+            # resolve preferred url once instead of in an each consumer
+            mirror_info['mirror_url'] = get_mirror_url(
+                mirror_info['address'],
             )
             result.append(mirror_info)
 
@@ -289,15 +332,15 @@ def get_verified_mirrors(
             mirror_info['status'] = 'ok'
             mirrors_info[mirror_info['name']] = mirror_info
             continue
-        args.append((mirror_info, versions, repos))
+        args.append((mirror_info, versions, repos, allowed_outdate))
         mirrors_info[mirror_info['name']] = mirror_info
     pool = multiprocessing.Pool(
         processes=NUMBER_OF_PROCESSES_FOR_MIRRORS_CHECK,
     )
     pool_result = pool.map(_helper_mirror_available, args)
-    for mirror_name, is_available in pool_result:
+    for mirror_name, is_available, status in pool_result:
         if is_available:
-            set_repo_status(mirrors_info[mirror_name], allowed_outdate)
+            mirrors_info[mirror_name]['status'] = status
         else:
             del mirrors_info[mirror_name]
     result = sorted(
@@ -308,7 +351,15 @@ def get_verified_mirrors(
 
 
 def _helper_mirror_available(args):
-    return mirror_available(*args)
+    """
+    Check availability and status of a mirror inside a pool worker,
+    so the timestamp requests are done in parallel too
+    """
+    mirror_info, versions, repos, allowed_outdate = args
+    mirror_name, is_available = mirror_available(mirror_info, versions, repos)
+    if is_available:
+        set_repo_status(mirror_info, allowed_outdate)
+    return mirror_name, is_available, mirror_info.get('status')
 
 
 def write_mirrors_to_mirrorslists(
@@ -329,6 +380,20 @@ def write_mirrors_to_mirrorslists(
                            per an each version
     """
 
+    # paths of mirrorlists are the same for all of mirrors
+    mirrorlist_paths = {}
+    for version in versions:
+        version_dir = os.path.join(
+            mirrorlist_dir,
+            str(version),
+        )
+        os.makedirs(version_dir, exist_ok=True)
+        for repo_info in repos:
+            mirrorlist_paths[version, repo_info['name']] = os.path.join(
+                version_dir,
+                repo_info['name'],
+            )
+    mirrorlists = defaultdict(list)
     for mirror_info in verified_mirrors:
         if mirror_info['status'] != 'ok':
             logger.warning(
@@ -336,29 +401,30 @@ def write_mirrors_to_mirrorslists(
                 mirror_info['name']
             )
             continue
-        addresses = mirror_info['address']
         for version in versions:
-            version_dir = os.path.join(
-                mirrorlist_dir,
-                str(version),
-            )
-            os.makedirs(version_dir, exist_ok=True)
             for repo_info in repos:
-                mirror_url = next(iter([
-                    address for protocol_type, address in addresses.items()
-                    if protocol_type in REQUIRED_MIRROR_PROTOCOLS
-                ]))
                 full_mirror_path = os.path.join(
-                    mirror_url,
+                    mirror_info['mirror_url'],
                     str(version),
                     repo_info['path'],
                 )
-                mirrorlist_path = os.path.join(
-                    version_dir,
-                    repo_info['name'],
-                )
-                with open(mirrorlist_path, 'a') as mirrorlist_file:
-                    mirrorlist_file.write(f'{full_mirror_path}\n')
+                mirrorlist_path = mirrorlist_paths[version, repo_info['name']]
+                mirrorlists[mirrorlist_path].append(full_mirror_path)
+    # write an each mirrorlist at once instead of reopening it per mirror
+    for mirrorlist_path, mirrors_paths in mirrorlists.items():
+        with open(mirrorlist_path, 'a') as mirrorlist_file:
+            mirrorlist_file.writelines(
+                f'{full_mirror_path}\n' for full_mirror_path in mirrors_paths
+            )
+
+
+@lru_cache(maxsize=None)
+def get_geoip_db() -> Reader:
+    """
+    Open GeoIP db once and share the reader between all lookups
+    """
+
+    return Reader(GEOPIP_DB)
 
 
 def set_mirror_country(
@@ -376,7 +442,7 @@ def set_mirror_country(
         logger.error('Can\'t get IP of mirror %s', mirror_name)
         mirror_info['country'] = 'Unknown'
         return
-    db = Reader(GEOPIP_DB)
+    db = get_geoip_db()
     logger.info('Set country for mirror "%s"', mirror_name)
     try:
         match = db.city(ip)  # type: City
@@ -460,7 +526,9 @@ def generate_isos_list(
     """
     mirrors_by_countries = defaultdict(list)
     for mirror_info in verified_mirrors:
-        mirrors_by_countries[mirror_info['country']].append(mirror_info)
+        mirrors_by_countries[mirror_info['country']].append(
+            (mirror_info['name'], mirror_info['mirror_url']),
+        )
     with open(isos_file, 'a') as isos_list_file:
         isos_list_file.write(
             '| Architecture | Version |\n'
@@ -474,12 +542,11 @@ def generate_isos_list(
                 ),
                 exist_ok=True,
             )
-            table_row = f'| {arch} | '
-            for version in versions:
-                table_row = f'{table_row}[{version}](/isos/' \
-                            f'{arch}/{version})</br>'
-            table_row = f'{table_row} |'
-            isos_list_file.write(f'{table_row}\n')
+            versions_links = ''.join(
+                f'[{version}](/isos/{arch}/{version})</br>'
+                for version in versions
+            )
+            isos_list_file.write(f'| {arch} | {versions_links} |\n')
     for arch in ARCHS:
         for version in versions:
             with open(
@@ -505,26 +572,19 @@ def generate_isos_list(
                     '| Location | Links |\n'
                     '| :--- | :--- |\n'
                 )
+                isos_path = os.path.join(
+                    str(version),
+                    'isos',
+                    arch,
+                )
                 for country, country_mirrors in \
                         mirrors_by_countries.items():
-                    table_row = f'| {country} | '
-                    for mirror_info in country_mirrors:
-                        addresses = mirror_info['address']
-                        mirror_url = next(iter([
-                            address for protocol_type, address in
-                            addresses.items()
-                            if protocol_type in REQUIRED_MIRROR_PROTOCOLS
-                        ]))
-                        full_isos_url = os.path.join(
-                            mirror_url,
-                            str(version),
-                            'isos',
-                            arch,
-                        )
-                        table_row = f'{table_row}[{mirror_info["name"]}]' \
-                                    f'({full_isos_url})</br>'
-                    table_row = f'{table_row} |'
-                    current_isos_file.write(f'{table_row}\n')
+                    isos_links = ''.join(
+                        f'[{mirror_name}]'
+                        f'({os.path.join(mirror_url, isos_path)})</br>'
+                        for mirror_name, mirror_url in country_mirrors
+                    )
+                    current_isos_file.write(f'| {country} | {isos_links} |\n')
 
 
 def clear_old_mirror_content(
@@ -540,17 +600,17 @@ def clear_old_mirror_content(
         os.remove(isos_file)
     if os.path.exists(mirrors_table_path):
         os.remove(mirrors_table_path)
-    for file_item in glob(os.path.join(isos_dir, '*')):
-        if os.path.isfile(file_item):
-            os.remove(file_item)
-        elif os.path.isdir(file_item):
-            shutil.rmtree(file_item)
+    # generate_isos_list recreates the dir, so just drop it as a whole
+    shutil.rmtree(
+        isos_dir,
+        ignore_errors=True,
+    )
 
 
 def main():
     config = get_config()
     versions = config['versions']
-    duplicated_versions = config['duplicated_versions']
+    duplicated_versions = set(config['duplicated_versions'])
     repos = config['repos']
     mirrors_table_path = config['mirrors_table']
     isos_file = 'docs/internal/isos.md'